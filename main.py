@@ -1,29 +1,166 @@
 import os
-from fastapi import FastAPI, HTTPException
+import asyncio
+import hashlib
+import orjson
+from fastapi import FastAPI, HTTPException, Request, Response
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import ORJSONResponse
 from pydantic import BaseModel
+from pymongo import IndexModel
+from pymongo.errors import BulkWriteError
 from typing import List, Optional, Literal, Dict, Any
-from datetime import datetime
 
 from database import db, create_document, get_documents
 from schemas import Device, Alert, SmartPerformance
 
-app = FastAPI(title="UEM Dashboard API")
+app = FastAPI(title="UEM Dashboard API", default_response_class=ORJSONResponse)
+
+# Comma-separated list of frontend origins. When unset any origin is allowed,
+# but without credentials, so cookies are never sent cross-origin.
+FRONTEND_URL = os.getenv("FRONTEND_URL", "")
+ALLOWED_ORIGINS = [o.strip() for o in FRONTEND_URL.split(",") if o.strip()]
 
 app.add_middleware(
     CORSMiddleware,
-    allow_origins=["*"],
-    allow_credentials=True,
-    allow_methods=["*"],
-    allow_headers=["*"],
+    allow_origins=ALLOWED_ORIGINS or ["*"],
+    allow_credentials=bool(ALLOWED_ORIGINS),
+    allow_methods=["GET", "POST"],
+    allow_headers=["content-type", "if-none-match"],
+    max_age=86400,
 )
 
+# Fail fast at boot instead of checking for a database on every request
+@app.on_event("startup")
+async def require_database():
+    if db is None:
+        raise RuntimeError("Database not available. Check DATABASE_URL and DATABASE_NAME environment variables.")
+
+# ETag helpers
+def _etag_for(body: bytes) -> str:
+    return '"%s"' % hashlib.blake2b(body, digest_size=16).hexdigest()
+
+def _etag_matches(request: Request, etag: str) -> bool:
+    header = request.headers.get("if-none-match")
+    if not header:
+        return False
+    tags = [t.strip().removeprefix("W/") for t in header.split(",")]
+    return "*" in tags or etag in tags
+
+def _etag_response(request: Request, body: bytes, etag: str) -> Response:
+    """Serve a JSON body with its ETag, or an empty 304 if the client already has it"""
+    if _etag_matches(request, etag):
+        return Response(status_code=304, headers={"ETag": etag})
+    return Response(content=body, media_type="application/json", headers={"ETag": etag})
+
+# Schemas never change at runtime, so build and serialize them once
+_SCHEMA_JSON = orjson.dumps({
+    "device": Device.model_json_schema(),
+    "alert": Alert.model_json_schema(),
+    "smartperformance": SmartPerformance.model_json_schema(),
+})
+_SCHEMA_ETAG = _etag_for(_SCHEMA_JSON)
+
+# /dashboard queries, built once at import; PyMongo never mutates these
+def _count_if(cond):
+    return {"$sum": {"$cond": [cond, 1, 0]}}
+
+def _first(path):
+    """First element of a facet array, or 0 when the facet is empty"""
+    return {"$ifNull": [{"$arrayElemAt": [path, 0]}, 0]}
+
+_NEWEST_FIRST = [("_id", -1)]
+
+# Most recent alerts: a plain find so the sort walks the default _id index
+# (a $sort inside $facet never uses an index)
+_TOP5_ALERT_PROJECTION = {"device_id": 1, "severity": 1, "component": 1, "message": 1, "timestamp": 1}
+
+_SMART_PERFORMANCE_PROJECTION = {
+    "_id": 0,
+    "disk_reclaimed_count": 1,
+    "tune_pc_fix_count": 1,
+    "malware_fix_count": 1,
+    "internet_performance_count": 1,
+}
+
+_DEVICE_INFO_PIPELINE = [
+    {"$facet": {
+        "counts": [{"$group": {
+            "_id": None,
+            "total": {"$sum": 1},
+            "installed": _count_if({"$eq": ["$installed", True]}),
+            "not_installed": _count_if({"$eq": ["$installed", False]}),
+            "laptops": _count_if({"$eq": ["$type", "laptop"]}),
+            "desktops": _count_if({"$eq": ["$type", "desktop"]}),
+        }}],
+        "manufacturers": [
+            {"$group": {"_id": "$manufacturer", "count": {"$sum": 1}}},
+            {"$sort": {"count": -1, "_id": 1}},
+            {"$project": {"_id": 0, "manufacturer": "$_id", "count": 1}},
+        ],
+    }},
+    {"$project": {
+        "total": _first("$counts.total"),
+        "installed": _first("$counts.installed"),
+        "not_installed": _first("$counts.not_installed"),
+        "laptops": _first("$counts.laptops"),
+        "desktops": _first("$counts.desktops"),
+        "manufacturers": "$manufacturers",
+    }},
+]
+
+_ALERTS_PIPELINE = [
+    {"$facet": {
+        "counts": [{"$group": {
+            "_id": None,
+            "critical": _count_if({"$eq": ["$severity", "critical"]}),
+            "warning": _count_if({"$eq": ["$severity", "warning"]}),
+        }}],
+        "by_component": [
+            {"$group": {"_id": "$component", "count": {"$sum": 1}}},
+            {"$sort": {"count": -1, "_id": 1}},
+            {"$project": {"_id": 0, "component": "$_id", "count": 1}},
+        ],
+    }},
+    {"$project": {
+        "critical": _first("$counts.critical"),
+        "warning": _first("$counts.warning"),
+        "by_component": "$by_component",
+    }},
+]
+
 @app.get("/")
-def root():
+async def root():
     return {"message": "UEM Dashboard Backend Running"}
 
+# Liveness: process is up, never touches the database
+@app.get("/livez")
+async def liveness():
+    return {"status": "ok"}
+
+# Readiness: a server-side ping, O(1) on MongoDB
+@app.get("/readyz")
+async def readiness():
+    try:
+        await db.command("ping")
+    except Exception as e:
+        raise HTTPException(status_code=503, detail=f"Database unreachable: {str(e)[:80]}")
+    return {"status": "ok"}
+
+# listCollections is an admin command; /test only needs a recent answer
+COLLECTIONS_CACHE_TTL = 30  # seconds
+
+_collections_cache = None  # (expires_at, names)
+
+async def _collection_names():
+    global _collections_cache
+    now = asyncio.get_running_loop().time()
+    if _collections_cache is None or _collections_cache[0] <= now:
+        names = await db.list_collection_names()
+        _collections_cache = (now + COLLECTIONS_CACHE_TTL, names[:10])
+    return _collections_cache[1]
+
 @app.get("/test")
-def test_database():
+async def test_database():
     response = {
         "backend": "✅ Running",
         "database": "❌ Not Available",
@@ -37,11 +174,11 @@ def test_database():
             response["database"] = "✅ Connected"
             response["connection_status"] = "Connected"
             try:
-                collections = db.list_collection_names()
-                response["collections"] = collections[:10]
+                response["collections"] = await _collection_names()
             except Exception as e:
                 response["database"] = f"⚠️ Connected but error: {str(e)[:80]}"
         else:
+            # Unreachable once require_database has passed at startup
             response["database"] = "⚠️ Available but not initialized"
     except Exception as e:
         response["database"] = f"❌ Error: {str(e)[:80]}"
@@ -49,12 +186,12 @@ def test_database():
 
 # Seed demo data if collections are empty (idempotent)
 @app.post("/seed", tags=["demo"])
-def seed_demo_data():
-    if db is None:
-        raise HTTPException(status_code=500, detail="Database not configured")
-
-    # Only seed if empty
-    if db["device"].count_documents({}) == 0:
+async def seed_demo_data():
+    # Only seed if empty. The unique device_id index is built here rather than
+    # at startup, so boot never waits on MongoDB; it makes a racing second
+    # /seed skip duplicates instead of failing.
+    if await db["device"].estimated_document_count() == 0:
+        await db["device"].create_indexes([IndexModel("device_id", unique=True)])
         devices = [
             {"device_id": "D-1001", "hostname": "LAPTOP-01", "type": "laptop", "manufacturer": "Dell", "installed": True, "os": "Windows 11"},
             {"device_id": "D-1002", "hostname": "DESKTOP-01", "type": "desktop", "manufacturer": "HP", "installed": False, "os": "Windows 10"},
@@ -62,20 +199,25 @@ def seed_demo_data():
             {"device_id": "D-1004", "hostname": "DESKTOP-02", "type": "desktop", "manufacturer": "Dell", "installed": True, "os": "Windows 10"},
             {"device_id": "D-1005", "hostname": "LAPTOP-03", "type": "laptop", "manufacturer": "Acer", "installed": False, "os": "Windows 10"}
         ]
-        db["device"].insert_many(devices)
+        try:
+            await db["device"].insert_many(devices, ordered=False)
+        except BulkWriteError as e:
+            if e.details.get("writeConcernErrors") or any(err["code"] != 11000 for err in e.details["writeErrors"]):
+                raise
 
-    if db["alert"].count_documents({}) == 0:
+    # Alerts have no natural key: only seed if empty
+    if await db["alert"].estimated_document_count() == 0:
         alerts = [
-            {"device_id": "D-1001", "severity": "critical", "component": "CPU", "message": "CPU over 95% for 10m", "timestamp": datetime.utcnow()},
-            {"device_id": "D-1002", "severity": "warning", "component": "HDD", "message": "Disk fragmented", "timestamp": datetime.utcnow()},
-            {"device_id": "D-1003", "severity": "warning", "component": "RAM", "message": "High memory usage", "timestamp": datetime.utcnow()},
-            {"device_id": "D-1004", "severity": "critical", "component": "Battery", "message": "Battery health low", "timestamp": datetime.utcnow()},
-            {"device_id": "D-1005", "severity": "warning", "component": "CPU", "message": "Background process spike", "timestamp": datetime.utcnow()},
-            {"device_id": "D-1001", "severity": "critical", "component": "HDD", "message": "SMART errors detected", "timestamp": datetime.utcnow()}
+            {"device_id": "D-1001", "severity": "critical", "component": "CPU", "message": "CPU over 95% for 10m"},
+            {"device_id": "D-1002", "severity": "warning", "component": "HDD", "message": "Disk fragmented"},
+            {"device_id": "D-1003", "severity": "warning", "component": "RAM", "message": "High memory usage"},
+            {"device_id": "D-1004", "severity": "critical", "component": "Battery", "message": "Battery health low"},
+            {"device_id": "D-1005", "severity": "warning", "component": "CPU", "message": "Background process spike"},
+            {"device_id": "D-1001", "severity": "critical", "component": "HDD", "message": "SMART errors detected"}
         ]
-        db["alert"].insert_many(alerts)
+        await db["alert"].insert_many(alerts, ordered=False)
 
-    if db["smartperformance"].count_documents({}) == 0:
+    if await db["smartperformance"].estimated_document_count() == 0:
         perf = {
             "period": "week",
             "disk_reclaimed_count": 120,
@@ -83,49 +225,81 @@ def seed_demo_data():
             "malware_fix_count": 32,
             "internet_performance_count": 74,
         }
-        db["smartperformance"].insert_one(perf)
+        await db["smartperformance"].insert_one(perf)
 
+    _invalidate_dashboard_cache()
     return {"status": "ok"}
 
+# Dashboard result cache: pollers within the TTL share one serialized body,
+# and concurrent misses share a single in-flight refresh
+DASHBOARD_CACHE_TTL = 2  # seconds
+
+_dashboard_cache = None  # (expires_at, body, etag)
+_dashboard_refresh = None
+_dashboard_generation = 0  # bumped on invalidation so in-flight refreshes are discarded
+
+def _invalidate_dashboard_cache():
+    global _dashboard_cache, _dashboard_refresh, _dashboard_generation
+    _dashboard_generation += 1
+    _dashboard_cache = None
+    _dashboard_refresh = None
+
+def _clear_dashboard_refresh(task):
+    global _dashboard_refresh
+    if _dashboard_refresh is task:
+        _dashboard_refresh = None
+
+async def _refresh_dashboard():
+    """Recompute the dashboard body and cache it unless invalidated meanwhile"""
+    global _dashboard_cache
+    generation = _dashboard_generation
+    body = orjson.dumps(await _compute_dashboard())
+    etag = _etag_for(body)
+    if generation == _dashboard_generation:
+        _dashboard_cache = (asyncio.get_running_loop().time() + DASHBOARD_CACHE_TTL, body, etag)
+    return body, etag
+
+async def _get_dashboard_body():
+    """Return (body, etag) for /dashboard, hitting MongoDB at most once per TTL"""
+    global _dashboard_refresh
+    cache = _dashboard_cache
+    if cache is not None and cache[0] > asyncio.get_running_loop().time():
+        return cache[1], cache[2]
+    if _dashboard_refresh is None:
+        _dashboard_refresh = asyncio.ensure_future(_refresh_dashboard())
+        _dashboard_refresh.add_done_callback(_clear_dashboard_refresh)
+    return await asyncio.shield(_dashboard_refresh)
+
 # Dashboard aggregated metrics endpoint
 @app.get("/dashboard", tags=["dashboard"])
-def get_dashboard():
-    if db is None:
-        raise HTTPException(status_code=500, detail="Database not configured")
+async def get_dashboard(request: Request):
+    body, etag = await _get_dashboard_body()
+    response = _etag_response(request, body, etag)
+    response.headers["Cache-Control"] = f"max-age={DASHBOARD_CACHE_TTL}"
+    return response
 
+async def _compute_dashboard():
     # SmartPerformance (latest doc)
-    sp = db["smartperformance"].find_one(sort=[("_id", -1)]) or {}
-
-    # Device info aggregations
-    total_devices = db["device"].count_documents({})
-    installed_count = db["device"].count_documents({"installed": True})
-    not_installed_count = db["device"].count_documents({"installed": False})
-    laptop_count = db["device"].count_documents({"type": "laptop"})
-    desktop_count = db["device"].count_documents({"type": "desktop"})
-
-    # Manufacturer-wise counts
-    pipeline = [{"$group": {"_id": "$manufacturer", "count": {"$sum": 1}}}, {"$sort": {"count": -1}}]
-    manufacturer_counts = [
-        {"manufacturer": d["_id"], "count": d["count"]}
-        for d in db["device"].aggregate(pipeline)
-    ]
+    sp = await db["smartperformance"].find_one({}, _SMART_PERFORMANCE_PROJECTION, sort=_NEWEST_FIRST) or {}
 
-    # Alerts section
-    critical_count = db["alert"].count_documents({"severity": "critical"})
-    warning_count = db["alert"].count_documents({"severity": "warning"})
+    # Device info and alert counts, shaped server-side into their response sections
+    device_info = (await db["device"].aggregate(_DEVICE_INFO_PIPELINE).to_list(1))[0]
+    alerts = (await db["alert"].aggregate(_ALERTS_PIPELINE).to_list(1))[0]
 
-    # Alerts by component
-    comp_pipeline = [{"$group": {"_id": "$component", "count": {"$sum": 1}}}, {"$sort": {"count": -1}}]
-    alerts_by_component = [
-        {"component": d["_id"], "count": d["count"]}
-        for d in db["alert"].aggregate(comp_pipeline)
+    # Top 5 alerts (most recent); legacy documents keep their stored timestamp,
+    # newer ones fall back to the ObjectId generation time
+    alerts["top5"] = [
+        {
+            "device_id": a.get("device_id"),
+            "severity": a.get("severity"),
+            "component": a.get("component"),
+            "message": a.get("message"),
+            "timestamp": a.get("timestamp") or a["_id"].generation_time,
+            "id": str(a["_id"]),
+        }
+        async for a in db["alert"].find({}, _TOP5_ALERT_PROJECTION).sort(_NEWEST_FIRST).limit(5)
     ]
 
-    # Top 5 alerts (most recent)
-    top_alerts = list(db["alert"].find().sort("timestamp", -1).limit(5))
-    for a in top_alerts:
-        a["id"] = str(a.pop("_id", ""))
-
     return {
         "smart_performance": {
             "disk_reclaimed_count": sp.get("disk_reclaimed_count", 0),
@@ -133,32 +307,24 @@ def get_dashboard():
             "malware_fix_count": sp.get("malware_fix_count", 0),
             "internet_performance_count": sp.get("internet_performance_count", 0),
         },
-        "device_info": {
-            "total": total_devices,
-            "installed": installed_count,
-            "not_installed": not_installed_count,
-            "laptops": laptop_count,
-            "desktops": desktop_count,
-            "manufacturers": manufacturer_counts,
-        },
-        "alerts": {
-            "critical": critical_count,
-            "warning": warning_count,
-            "by_component": alerts_by_component,
-            "top5": top_alerts,
-        },
+        "device_info": device_info,
+        "alerts": alerts,
     }
 
 # Expose schemas for viewer tools
 @app.get("/schema")
-def get_schema_definitions():
-    return {
-        "device": Device.model_json_schema(),
-        "alert": Alert.model_json_schema(),
-        "smartperformance": SmartPerformance.model_json_schema(),
-    }
+async def get_schema_definitions(request: Request):
+    return _etag_response(request, _SCHEMA_JSON, _SCHEMA_ETAG)
 
 if __name__ == "__main__":
     import uvicorn
     port = int(os.getenv("PORT", 8000))
-    uvicorn.run(app, host="0.0.0.0", port=port)
+    uvicorn.run(
+        "main:app",
+        host="0.0.0.0",
+        port=port,
+        loop="uvloop",
+        http="httptools",
+        workers=int(os.getenv("WEB_CONCURRENCY", "1")),
+        log_level="warning",
+    )
@@ -5,7 +5,6 @@ Each Pydantic model represents a MongoDB collection (collection name = lowercase
 """
 from pydantic import BaseModel, Field
 from typing import Optional, Literal
-from datetime import datetime
 
 class Device(BaseModel):
     device_id: str = Field(..., description="Unique device identifier")
@@ -20,7 +19,6 @@ class Alert(BaseModel):
     severity: Literal["critical", "warning", "info"] = Field(...)
     component: Literal["CPU", "HDD", "RAM", "Battery"] = Field(...)
     message: str = Field(...)
-    timestamp: datetime = Field(default_factory=datetime.utcnow)
 
 class SmartPerformance(BaseModel):
     period: str = Field(..., description="Aggregation period label, e.g., 'today', 'week', 'month'")